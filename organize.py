@@ -1,11 +1,22 @@
 import os
-import re
+import errno
 import shutil
 import yaml
 import json
 import sys
 import argparse
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# Prefer libyaml's C implementation, falling back to the pure-Python one
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    HAS_LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+    HAS_LIBYAML = False
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Organize Obsidian vault based on tags")
@@ -20,9 +31,12 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)]
 )
 
+if not HAS_LIBYAML:
+    logging.warning("⚠️ libyaml not available, falling back to the slower pure-Python YAML parser")
+
 # Load configuration from YAML file
 with open('config.yaml', 'r', encoding='utf-8') as f:
-    config = yaml.safe_load(f)
+    config = yaml.load(f, Loader=SafeLoader)
 
 # Assign configuration to variables
 VAULT_ROOT = config['vault_root']
@@ -31,218 +45,286 @@ CATEGORY_RULES = config['category_rules']
 SUBCATEGORY_RULES = config['subcategory_rules']
 TAG_CONSOLIDATION = config['tag_consolidation']
 
-YAML_FRONTMATTER_REGEX = re.compile(r"(?s)^---\n(.*?)\n---\n")
+# Characters read at a time while looking for the end of the frontmatter
+FRONTMATTER_CHUNK_SIZE = 65536
 
-def flatten_subcategory_order(subcategory_rules):
+def build_subcategory_indexes(subcategory_rules, category_rules):
+    """Walk the subcategory rules once and return (ordered_tags, flat_map, category_to_subpaths)"""
     ordered_tags = []
-
-    def walk(node):
-        if isinstance(node, list):
-            for item in node:
-                walk(item)
-        elif isinstance(node, dict):
-            for key, val in node.items():
-                ordered_tags.append(key.lower())
-                walk(val)
-        elif isinstance(node, str):
-            ordered_tags.append(node.lower())
-
-    for cat_key, branches in subcategory_rules.items():
-        walk(branches)
-
-    return ordered_tags
-
-SUBCATEGORY_ORDER = flatten_subcategory_order(SUBCATEGORY_RULES)
-
-def build_subcategory_paths(subcategory_rules, category_rules):
+    order_index = {}
     flat_map = {}
 
-    def walk(parent_path, node):
+    # Get main folder from category_rules, fallback to cat_key itself if not found.
+    # Children are pushed in reverse so they are popped in config order.
+    stack = [
+        (category_rules.get(cat_key, cat_key), branches)
+        for cat_key, branches in reversed(list(subcategory_rules.items()))
+    ]
+
+    while stack:
+        parent_path, node = stack.pop()
         if isinstance(node, list):
-            for item in node:
-                walk(parent_path, item)
+            stack.extend((parent_path, item) for item in reversed(node))
         elif isinstance(node, dict):
-            for key, val in node.items():
-                folder_name = key.capitalize()
-                full_path = f"{parent_path}/{folder_name}" if parent_path else folder_name
-                flat_map[key.lower()] = full_path
-                walk(full_path, val)
-        elif isinstance(node, str):
-            folder_name = node.capitalize()
+            stack.extend((parent_path, item) for item in reversed(list(node.items())))
+        else:
+            # Leaf tag (str) or dict entry (key, children)
+            key, children = node if isinstance(node, tuple) else (node, None)
+            if not isinstance(key, str):
+                continue
+            tag = key.lower()
+            folder_name = key.capitalize()
             full_path = f"{parent_path}/{folder_name}" if parent_path else folder_name
-            flat_map[node.lower()] = full_path
-
-    for cat_key, branches in subcategory_rules.items():
-        # Get main folder from category_rules, fallback to cat_key itself if not found
-        main_folder = category_rules.get(cat_key, cat_key)
-        walk(main_folder, branches)
-
-    return flat_map
-
+            ordered_tags.append(tag)
+            order_index.setdefault(tag, len(ordered_tags) - 1)
+            flat_map[tag] = full_path
+            if children is not None:
+                stack.append((full_path, children))
+
+    # Group by top level folder as {tag: (depth, order_index, path)}
+    category_to_subpaths = {}
+    for tag, path in flat_map.items():
+        top_level_folder = path.split("/")[0].lower()
+        depth = path.count("/")
+        category_to_subpaths.setdefault(top_level_folder, {})[tag] = (depth, order_index[tag], path)
+
+    return ordered_tags, flat_map, category_to_subpaths
+
+# Category rules with lowercased keys, in config order
+CATEGORY_KEYS_LOWER = [(k.lower(), v) for k, v in CATEGORY_RULES.items()]
 # Reverse lookup: folder name (like "6_Lore") -> tag (like "lore")
 FOLDER_TO_CATEGORY = {v.lower(): k.lower() for k, v in CATEGORY_RULES.items()}
-# Build flat map once
-SUBCATEGORY_PATHS = build_subcategory_paths(SUBCATEGORY_RULES, CATEGORY_RULES)
+# Build flat map and per main folder candidates once; ordering is folded into the candidates
+_, SUBCATEGORY_PATHS, CATEGORY_TO_SUBPATHS = build_subcategory_indexes(
+    SUBCATEGORY_RULES, CATEGORY_RULES
+)
+
+def build_parent_chain(path):
+    """Parent tags implied by a subcategory path: the top level tag, then intermediate folders"""
+    parts = path.split("/")
+    top_level_tag = FOLDER_TO_CATEGORY.get(parts[0].lower())
+    parents = [top_level_tag] if top_level_tag else []
+    parents.extend(part.lower() for part in parts[1:-1])
+    return tuple(parents)
+
+# Parent tags for every subcategory tag, so tagging notes needs no string splitting
+TAG_PARENT_CHAIN = {tag: build_parent_chain(path) for tag, path in SUBCATEGORY_PATHS.items()}
 
 # === FUNCTIONS ===
 
 def normalize_tags(tags):
     return [t.lower() for t in tags if isinstance(t, str)]
 
+@lru_cache(maxsize=1024)
+def load_frontmatter_block(block):
+    """Parse a frontmatter block, reusing results for identical blocks.
+    The returned dict is shared between callers and must not be mutated."""
+    return yaml.load(block, Loader=SafeLoader) or {}
+
+def find_frontmatter(content, search_from=4):
+    """Locate a leading frontmatter block and return (block, body_offset), or None.
+    search_from lets callers skip text already known not to hold the closing delimiter."""
+    if not content.startswith("---\n"):
+        return None
+    end = content.find("\n---\n", max(search_from, 4))
+    if end == -1:
+        return None
+    return content[4:end], end + 5
+
 def parse_yaml_frontmatter(filepath):
+    """Read only the start of a note and return (yaml_data, frontmatter).
+    frontmatter is the (block, body_offset) pair from find_frontmatter, or None."""
+    head = ""
+    search_from = 4
     try:
         with open(filepath, encoding="utf-8") as f:
-            content = f.read()
+            while True:
+                chunk = f.read(FRONTMATTER_CHUNK_SIZE)
+                head += chunk
+                frontmatter = find_frontmatter(head, search_from)
+                # Stop once the block is closed, there is no frontmatter, or the file ends
+                if frontmatter or not head.startswith("---\n") or len(chunk) < FRONTMATTER_CHUNK_SIZE:
+                    break
+                # Only rescan enough old text to catch a delimiter split across chunks,
+                # keeping the scan linear for notes with an unclosed block
+                search_from = len(head) - len("\n---\n") + 1
     except Exception as e:
-        logging.warn(f"⚠️ Failed to read {filepath}: {e}")
-        return {}
+        logging.warning("⚠️ Failed to read %s: %s", filepath, e)
+        return {}, None
 
-    match = YAML_FRONTMATTER_REGEX.match(content)
-    if not match:
-        return {}
+    if not frontmatter:
+        return {}, None
 
     try:
-        return yaml.safe_load(match.group(1)) or {}
+        return load_frontmatter_block(frontmatter[0]), frontmatter
     except Exception as e:
-        logging.warn(f"⚠️ YAML parse error in {filepath}: {e}")
-        return {}
-
-def write_yaml_frontmatter(filepath, data, original_content):
-    new_yaml = yaml.safe_dump(data, sort_keys=False).strip()
-
-    if YAML_FRONTMATTER_REGEX.search(original_content):
-        # Replace existing frontmatter
-        def replacer(match):
-            return f"---\n{new_yaml}\n---\n"
-        new_content = YAML_FRONTMATTER_REGEX.sub(replacer, original_content, count=1)
+        logging.warning("⚠️ YAML parse error in %s: %s", filepath, e)
+        return {}, frontmatter
+
+def write_yaml_frontmatter(filepath, data, original_content, frontmatter_end_offset=None):
+    new_yaml = yaml.dump(data, Dumper=SafeDumper, sort_keys=False).strip()
+
+    if frontmatter_end_offset is not None:
+        # Skip the write if the block would come out byte-identical
+        if original_content[4:frontmatter_end_offset - 5] == new_yaml:
+            return False
+        # Replace existing frontmatter, which ends at the given offset
+        new_content = f"---\n{new_yaml}\n---\n" + original_content[frontmatter_end_offset:]
     else:
         # No frontmatter exists, prepend new frontmatter block
         new_content = f"---\n{new_yaml}\n---\n\n{original_content}"
 
     with open(filepath, "w", encoding="utf-8") as f:
         f.write(new_content)
+    return True
 
 def consolidate_tags(tags):
     """Apply all tag consolidation rules and remove replaced tags"""
-    consolidated = []
+    # Dict keys keep first-seen order and give O(1) dedup
+    consolidated = {}
     replaced_tags = set()
 
     for input_tag in tags:
         replacement = TAG_CONSOLIDATION.get(input_tag, input_tag)
-        if replacement not in consolidated:
-            consolidated.append(replacement)
+        consolidated.setdefault(replacement)
         if replacement != input_tag:
             replaced_tags.add(input_tag)
 
     # Remove replaced tags from consolidated list if they are still there
-    final_tags = [tag for tag in consolidated if tag not in replaced_tags]
-    return final_tags
+    return [tag for tag in consolidated if tag not in replaced_tags]
 
 def add_parent_tags_for_subcategories(tags):
     tags_set = set(tags)
     added_tags = False
 
+    # Tags appended here are visited too, as they may imply parents of their own
     for tag in tags:
-        path = SUBCATEGORY_PATHS.get(tag)
-        if not path:
-            continue
-
-        parts = path.split("/")
-        top_level_folder = parts[0].lower()
-        top_level_tag = FOLDER_TO_CATEGORY.get(top_level_folder)
-
-        # Add top level tag if missing, append at the end
-        if top_level_tag and top_level_tag not in tags_set:
-            tags.append(top_level_tag)
-            tags_set.add(top_level_tag)
-            added_tags = True
-
-        # Add intermediate parts if missing, append at the end
-        for part in parts[1:-1]:
-            normalized_part = part.lower()
-            if normalized_part not in tags_set:
-                tags.append(normalized_part)
-                tags_set.add(normalized_part)
+        # Add top level and intermediate tags if missing, append at the end
+        for parent_tag in TAG_PARENT_CHAIN.get(tag, ()):
+            if parent_tag not in tags_set:
+                tags.append(parent_tag)
+                tags_set.add(parent_tag)
                 added_tags = True
 
     return tags, added_tags
 
-def classify_file(yaml_data):
-    tags = yaml_data.get("tags") or []
-
-    tags = normalize_tags(tags)
-    tags = consolidate_tags(tags)
+def classify_file(tags_lower):
+    """Classify a note from its already normalized tags"""
+    tags = consolidate_tags(tags_lower)
 
     tags, _ = add_parent_tags_for_subcategories(tags)
 
-    matching_main_keys = [key for key in CATEGORY_RULES if key.lower() in tags]
+    tags_set = set(tags)
 
-    if not matching_main_keys:
-        main_folder = DEFAULT_FOLDER
-    else:
-        main_folder = CATEGORY_RULES[matching_main_keys[0]]
+    # First category rule (in config order) whose tag is present wins
+    main_folder = next(
+        (folder for key_lower, folder in CATEGORY_KEYS_LOWER if key_lower in tags_set),
+        DEFAULT_FOLDER,
+    )
+    main_lower = main_folder.lower()
 
-    candidate_subfolders = []
+    candidate_subfolders = CATEGORY_TO_SUBPATHS.get(main_lower, {})
 
-    for tag in tags:
-        sub_path = SUBCATEGORY_PATHS.get(tag)
-        if sub_path and sub_path.lower().startswith(main_folder.lower()):
-            depth = sub_path.count("/")
-            order_index = SUBCATEGORY_ORDER.index(tag) if tag in SUBCATEGORY_ORDER else 1_000_000
-            candidate_subfolders.append((depth, order_index, sub_path))
-
-    if candidate_subfolders:
-        # Sort by descending depth, then ascending order_index
-        candidate_subfolders.sort(key=lambda x: (-x[0], x[1]))
-        subfolder = candidate_subfolders[0][2]
-    else:
-        subfolder = None
+    # Prefer the deepest subfolder, then the one listed first in the config
+    best_candidate = min(
+        (candidate_subfolders[tag] for tag in tags if tag in candidate_subfolders),
+        key=lambda x: (-x[0], x[1]),
+        default=None,
+    )
+    subfolder = best_candidate[2] if best_candidate else None
 
     return main_folder, subfolder, tags
 
-def move_file(filepath, dest_folder, vault_root):
-    dest_path_folder = os.path.join(vault_root, dest_folder)
-    os.makedirs(dest_path_folder, exist_ok=True)
+def move_file(filepath, dest_folder, vault_root, dest_cache=None):
+    # dest_cache maps each destination folder to its already created path for this run
+    dest_path_folder = dest_cache.get(dest_folder) if dest_cache is not None else None
+    if dest_path_folder is None:
+        dest_path_folder = os.path.join(vault_root, dest_folder)
+        os.makedirs(dest_path_folder, exist_ok=True)
+        if dest_cache is not None:
+            dest_cache[dest_folder] = dest_path_folder
 
     filename = os.path.basename(filepath)
-    dest_path = os.path.join(dest_path_folder, filename)
+    dest_path = f"{dest_path_folder}{os.sep}{filename}"
 
     if os.path.exists(dest_path):
         raise FileExistsError(f"❌ File already exists at destination: {dest_path}")
 
-    logging.debug(f"📁 Moving '{filename}' to '{dest_folder}/'")
-    shutil.move(filepath, dest_path)
+    logging.debug("📁 Moving '%s' to '%s/'", filename, dest_folder)
+    try:
+        # Same filesystem: only the directory entry needs updating
+        os.rename(filepath, dest_path)
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            shutil.move(filepath, dest_path)
+        elif e.errno == errno.EEXIST:
+            # Windows refuses to rename over an existing file
+            raise FileExistsError(f"❌ File already exists at destination: {dest_path}") from e
+        else:
+            raise
     return dest_path
 
-def update_tags_in_file(filepath, new_tags):
+def update_tags_in_file(filepath, new_tags, frontmatter):
+    # Only notes being rewritten need their full body
     try:
         with open(filepath, encoding="utf-8") as f:
             content = f.read()
     except Exception as e:
-        logging.warn(f"⚠️ Failed to read {filepath} for updating tags: {e}")
+        logging.warning("⚠️ Failed to read %s for updating tags: %s", filepath, e)
         return False
 
-    match = YAML_FRONTMATTER_REGEX.match(content)
-    if match:
-        yaml_data = yaml.safe_load(match.group(1)) or {}
+    if frontmatter:
+        # Copy so the cached frontmatter is left untouched
+        yaml_data = dict(load_frontmatter_block(frontmatter[0]))
     else:
         yaml_data = {}
 
     yaml_data['tags'] = new_tags
-    write_yaml_frontmatter(filepath, yaml_data, content)
-    logging.debug(f"📝 Updated tags in '{filepath}'")
+    frontmatter_end_offset = frontmatter[1] if frontmatter else None
+    if not write_yaml_frontmatter(filepath, yaml_data, content, frontmatter_end_offset):
+        return False
+    logging.debug("📝 Updated tags in '%s'", filepath)
+    return True
+
+def write_file_if_changed(path, data):
+    """Atomically replace path with data unless it already holds exactly those bytes"""
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    # Write a sibling temp file with raw syscalls, then swap it in so readers never see a torn file
+    tmp_path = f"{path}.tmp"
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    # 0o666 lets the umask decide permissions, as open(..., "w") did
+    fd = os.open(tmp_path, flags, 0o666)
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Don't leave a stray temp file in _indexes if the write or swap fails
+        os.unlink(tmp_path)
+        raise
     return True
 
 def update_indexes(tag_to_files_map, vault_root):
     index_dir = os.path.join(vault_root, "_indexes")
     os.makedirs(index_dir, exist_ok=True)
 
-    # Get all current index files
-    current_index_files = {
-        os.path.splitext(f)[0].lower(): os.path.join(index_dir, f)
-        for f in os.listdir(index_dir)
-        if f.endswith(".md")
-    }
+    # Get all current index files, keyed by tag (index files are named "_<tag>.md")
+    current_index_files = {}
+    for f in os.listdir(index_dir):
+        if f.endswith(".md"):
+            name = os.path.splitext(f)[0].lower()
+            tag = name[1:] if name.startswith("_") else name
+            current_index_files[tag] = os.path.join(index_dir, f)
 
     # Determine the tags we now care about (consolidated ones)
     updated_tags = set(tag_to_files_map.keys())
@@ -251,69 +333,94 @@ def update_indexes(tag_to_files_map, vault_root):
     for tag, path in current_index_files.items():
         if tag not in updated_tags:
             os.remove(path)
-            logging.debug(f"🗑️ Removed obsolete index: {tag}.md")
+            logging.debug("🗑️ Removed obsolete index: %s.md", tag)
 
     # Rebuild valid index files with proper tagging
     for tag, files in tag_to_files_map.items():
-        # Create content with tag reference
-        lines = [f"# Index for #{tag}"]
+        # Sort by note name, deriving each name once
+        note_names = sorted(os.path.splitext(os.path.basename(filepath))[0] for filepath in files)
 
-        for filepath in sorted(files):
-            note_name = os.path.splitext(os.path.basename(filepath))[0]
-            lines.append(f"- [[{note_name}]]")
-
-        content = "\n".join(lines)
+        # Create content with tag reference
+        content = "\n".join([f"# Index for #{tag}", *(f"- [[{note_name}]]" for note_name in note_names)])
 
         index_path = os.path.join(index_dir, f"_{tag}.md")
-        with open(index_path, "w", encoding="utf-8") as f:
-            f.write(content)
-        logging.debug(f"📄 Updated index for: {tag}")
-
-def organize_vault(vault_root):
-    logging.info(f"🔎 Scanning vault: {vault_root}")
-
-    tag_to_files_map = {}
+        if write_file_if_changed(index_path, content.encode("utf-8")):
+            logging.debug("📄 Updated index for: %s", tag)
 
-    for root, _, files in os.walk(vault_root):
-        rel_root = os.path.relpath(root, vault_root)
-        if rel_root == ".":
-            rel_root = ""
-
-        # Skip _indexes folder anywhere in path
-        if "_indexes" in rel_root.split(os.sep):
-            continue
-
-        for filename in files:
-            if not filename.endswith(".md"):
-                continue
+def iter_md_files(path, is_vault_root=True):
+    """Recursively yield DirEntry objects for markdown notes, skipping _indexes folders"""
+    try:
+        it = os.scandir(path)
+    except OSError as e:
+        # An unreadable vault is fatal, but unreadable subfolders are skipped like os.walk did
+        if is_vault_root:
+            raise
+        logging.warning("⚠️ Failed to scan %s: %s", path, e)
+        return
+
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name == "_indexes":
+                    continue
+                yield from iter_md_files(entry.path, is_vault_root=False)
+            # Symlinked folders are not recursed into, but must not be mistaken for notes either
+            elif entry.name.endswith(".md") and not entry.is_dir():
+                yield entry
+
+def process_file(filepath):
+    """Classify a note and rewrite its tags if needed. Returns (filepath, tags, target_folder)"""
+    yaml_data, frontmatter = parse_yaml_frontmatter(filepath)
+    # Normalize once; classify_file returns tags that are already lowercase
+    orig_tags_lower = normalize_tags(yaml_data.get("tags") or [])
+    main_folder, subfolder, updated_tags_lower = classify_file(orig_tags_lower)
+    orig_tags_set = frozenset(orig_tags_lower)
+
+    # updated_tags_lower has no duplicates, so equal length plus containment means equal sets
+    if len(updated_tags_lower) != len(orig_tags_set) or not orig_tags_set.issuperset(updated_tags_lower):
+        update_tags_in_file(filepath, updated_tags_lower, frontmatter)
+
+    # Determine target folder relative to vault root
+    target_folder = subfolder if subfolder else main_folder
+    return filepath, updated_tags_lower, target_folder
 
-            filepath = os.path.join(root, filename)
-            yaml_data = parse_yaml_frontmatter(filepath)
-            main_folder, subfolder, updated_tags = classify_file(yaml_data)
-            orig_tags = yaml_data.get("tags") or []
-            orig_tags_lower = normalize_tags(orig_tags)
-            updated_tags_lower = normalize_tags(updated_tags)
-
-            if set(updated_tags_lower) != set(orig_tags_lower):
-                update_tags_in_file(filepath, updated_tags)
-
-            for tag in updated_tags_lower:
-                tag_to_files_map.setdefault(tag, []).append(filepath)
-
-            # Determine target folder relative to vault root
-            target_folder = subfolder if subfolder else main_folder
-            target_folder_norm = os.path.normpath(target_folder)
-
-            # Current file folder relative to vault root
-            file_current_folder = os.path.relpath(root, vault_root)
-            file_current_folder_norm = os.path.normpath(file_current_folder)
-
-            # Move if current folder is different from target folder
-            if file_current_folder_norm.lower() != target_folder_norm.lower():
-                try:
-                    move_file(filepath, target_folder, vault_root)
-                except FileExistsError as e:
-                    logging.info(f"⚠️ Skipped moving due to existing file: {e}")
+def organize_vault(vault_root):
+    logging.info("🔎 Scanning vault: %s", vault_root)
+
+    # Collect paths up front so moves cannot affect the scan
+    filepaths = [entry.path for entry in iter_md_files(vault_root)]
+
+    # Reading, parsing and rewriting notes is I/O bound, so overlap it across threads
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process_file, filepaths))
+
+    tag_to_files_map = defaultdict(list)
+    vault_root_abs = os.path.abspath(vault_root)
+    dest_cache = {}
+    current_folder_cache = {}
+
+    # Apply moves serially to avoid racing on directory entries
+    for filepath, updated_tags_lower, target_folder in results:
+        for tag in updated_tags_lower:
+            tag_to_files_map[tag].append(filepath)
+
+        target_folder_norm = os.path.normpath(target_folder)
+
+        # Current file folder relative to vault root, computed once per directory
+        current_dir = os.path.dirname(filepath)
+        file_current_folder_norm_lower = current_folder_cache.get(current_dir)
+        if file_current_folder_norm_lower is None:
+            file_current_folder = os.path.relpath(current_dir, vault_root)
+            file_current_folder_norm_lower = os.path.normpath(file_current_folder).lower()
+            current_folder_cache[current_dir] = file_current_folder_norm_lower
+
+        # Move if current folder is different from target folder
+        if file_current_folder_norm_lower != target_folder_norm.lower():
+            try:
+                move_file(filepath, target_folder, vault_root_abs, dest_cache)
+            except FileExistsError as e:
+                logging.info("⚠️ Skipped moving due to existing file: %s", e)
 
     update_indexes(tag_to_files_map, vault_root)
     logging.info("✅ Vault organization complete!")
@@ -1,3 +1,4 @@
+import errno
 import pytest
 import yaml
 import os
@@ -6,11 +7,15 @@ from organize import (
     consolidate_tags,
     add_parent_tags_for_subcategories,
     classify_file,
-    build_subcategory_paths,
-    flatten_subcategory_order,
+    build_subcategory_indexes,
+    parse_yaml_frontmatter,
+    find_frontmatter,
+    move_file,
+    write_yaml_frontmatter,
     CATEGORY_RULES,
     SUBCATEGORY_RULES,
     TAG_CONSOLIDATION,
+    FRONTMATTER_CHUNK_SIZE,
     organize_vault
 )
 
@@ -22,6 +27,10 @@ def test_consolidate_tags():
     expected = ["towns", "nations"]
     assert consolidate_tags(original) == expected
 
+def test_consolidate_tags_deduplicates_replacements():
+    original = ["forts", "castles", "fortifications", "ruins"]
+    assert consolidate_tags(original) == ["fortifications", "ruins"]
+
 def test_add_parent_tags_for_subcategories_adds_expected():
     tags = ["cities"]
     enriched_tags, added = add_parent_tags_for_subcategories(tags[:])
@@ -35,30 +44,81 @@ def test_add_parent_tags_for_subcategories_ignores_unknown():
     assert enriched_tags == ["unknown"]
     assert added is False
 
-def test_flatten_subcategory_order_contains_depth_order():
-    order = flatten_subcategory_order(SUBCATEGORY_RULES)
+def test_build_subcategory_indexes_contains_depth_order():
+    order, _, _ = build_subcategory_indexes(SUBCATEGORY_RULES, CATEGORY_RULES)
     # Cities should come after settlements, but before forests
     assert order.index("cities") > order.index("settlements")
     assert order.index("forests") > order.index("cities")
 
-def test_build_subcategory_paths_contains_expected_paths():
-    paths = build_subcategory_paths(SUBCATEGORY_RULES, CATEGORY_RULES)
+def test_build_subcategory_indexes_contains_expected_paths():
+    _, paths, _ = build_subcategory_indexes(SUBCATEGORY_RULES, CATEGORY_RULES)
     assert paths["cities"].endswith("Locations/Settlements/Cities")
     assert paths["ruins"].endswith("Locations/Ruins")
 
+def test_build_subcategory_indexes_groups_by_main_folder():
+    order, paths, category_to_subpaths = build_subcategory_indexes(SUBCATEGORY_RULES, CATEGORY_RULES)
+    locations = category_to_subpaths[CATEGORY_RULES["locations"].lower()]
+    # 2_Locations/Settlements/Cities is two separators deep
+    assert locations["cities"] == (2, order.index("cities"), paths["cities"])
+    assert "history" not in locations
+
 def test_classify_file_prefers_deeper_path():
-    yaml_data = {"tags": ["ruins", "cities"]}
-    main, sub, tags = classify_file(yaml_data)
+    main, sub, tags = classify_file(["ruins", "cities"])
     # Cities is deeper (3 levels), so should be chosen
     assert sub.endswith("Locations/Settlements/Cities")
 
 def test_classify_file_prefers_earlier_if_same_depth():
-    yaml_data = {"tags": ["ruins", "nations"]}  # both 2 deep, but ruins should be chosen if listed earlier
-    order = flatten_subcategory_order(SUBCATEGORY_RULES)
+    tags_lower = ["ruins", "nations"]  # both 2 deep, but ruins should be chosen if listed earlier
+    order, _, _ = build_subcategory_indexes(SUBCATEGORY_RULES, CATEGORY_RULES)
     if order.index("ruins") < order.index("nations"):
-        main, sub, tags = classify_file(yaml_data)
+        main, sub, tags = classify_file(tags_lower)
         assert sub.endswith("Locations/Ruins")
 
+def test_parse_yaml_frontmatter_returns_block_and_offset(tmp_path):
+    note = tmp_path / "note.md"
+    content = "---\ntags:\n- ruins\n---\n\nBody"
+    note.write_text(content, encoding="utf-8")
+    yaml_data, (block, body_offset) = parse_yaml_frontmatter(str(note))
+    assert yaml_data == {"tags": ["ruins"]}
+    assert block == "tags:\n- ruins"
+    assert content[body_offset:] == "\nBody"
+
+def test_parse_yaml_frontmatter_finds_delimiter_split_across_chunks(tmp_path):
+    note = tmp_path / "split.md"
+    # Place the closing delimiter so it straddles the first chunk boundary
+    padding = "x" * (FRONTMATTER_CHUNK_SIZE - len("---\ntitle: ") - 2)
+    note.write_text(f"---\ntitle: {padding}\n---\n\nBody", encoding="utf-8")
+    yaml_data, _ = parse_yaml_frontmatter(str(note))
+    assert yaml_data == {"title": padding}
+
+def test_find_frontmatter_requires_closing_delimiter():
+    assert find_frontmatter("---\ntags: []\n----\nBody") is None
+    assert find_frontmatter("Body\n---\ntags: []\n---\n") is None
+
+def test_parse_yaml_frontmatter_reads_past_first_chunk(tmp_path):
+    note = tmp_path / "long.md"
+    long_value = "x" * (FRONTMATTER_CHUNK_SIZE + 10)
+    note.write_text(f"---\ntitle: {long_value}\ntags:\n- ruins\n---\n\nBody", encoding="utf-8")
+    yaml_data, _ = parse_yaml_frontmatter(str(note))
+    assert yaml_data["tags"] == ["ruins"]
+
+def test_write_yaml_frontmatter_skips_identical_block(tmp_path):
+    note = tmp_path / "note.md"
+    content = "---\ntags:\n- ruins\n---\n\nBody"
+    note.write_text(content, encoding="utf-8")
+    body_offset = find_frontmatter(content)[1]
+    assert write_yaml_frontmatter(str(note), {"tags": ["ruins"]}, content, body_offset) is False
+    assert write_yaml_frontmatter(str(note), {"tags": ["lore"]}, content, body_offset) is True
+    assert note.read_text(encoding="utf-8") == "---\ntags:\n- lore\n---\n\nBody"
+
+def test_move_file_refuses_to_overwrite(tmp_path):
+    (tmp_path / "note.md").write_text("source", encoding="utf-8")
+    (tmp_path / "6_Lore").mkdir()
+    (tmp_path / "6_Lore" / "note.md").write_text("existing", encoding="utf-8")
+    with pytest.raises(FileExistsError):
+        move_file(str(tmp_path / "note.md"), "6_Lore", str(tmp_path))
+    assert (tmp_path / "6_Lore" / "note.md").read_text(encoding="utf-8") == "existing"
+
 @pytest.fixture
 def sample_vault(tmp_path):
     # Create files with tags
@@ -78,3 +138,79 @@ def test_file_moves_correctly(sample_vault):
     assert (sample_vault / "2_Locations" / "Ruins" / "ruins_note.md").exists()
     assert (sample_vault / "2_Locations" / "Settlements" / "Cities" / "city_note.md").exists()
     assert (sample_vault / "6_Lore" / "basic_note.md").exists()
+
+def test_unreadable_subfolder_is_skipped(sample_vault, monkeypatch):
+    locked = sample_vault / "locked"
+    locked.mkdir()
+    (locked / "hidden_note.md").write_text("---\ntags:\n- lore\n---\n", encoding="utf-8")
+
+    real_scandir = os.scandir
+    def scandir(path):
+        if os.path.basename(os.fspath(path)) == "locked":
+            raise PermissionError(13, "Permission denied", os.fspath(path))
+        return real_scandir(path)
+    monkeypatch.setattr(os, "scandir", scandir)
+
+    organize_vault(str(sample_vault))
+
+    assert (sample_vault / "6_Lore" / "basic_note.md").exists()
+    assert (locked / "hidden_note.md").exists()
+
+def test_symlinked_folder_named_like_a_note_is_ignored(sample_vault, tmp_path_factory):
+    target = tmp_path_factory.mktemp("linked")
+    (sample_vault / "linked.md").symlink_to(target, target_is_directory=True)
+
+    organize_vault(str(sample_vault))
+
+    assert (sample_vault / "linked.md").is_symlink()
+
+def test_existing_target_folder_does_not_duplicate_index_entries(sample_vault, monkeypatch):
+    # Notes moved into a folder the scan has not reached yet must only be counted once
+    (sample_vault / "2_Locations" / "Ruins").mkdir(parents=True)
+    (sample_vault / "2_Locations" / "Settlements" / "Cities").mkdir(parents=True)
+
+    # List files before folders so a lazy scan would reach the moved notes again
+    class FilesFirstScandir(list):
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc_info):
+            return False
+
+    real_scandir = os.scandir
+    def scandir(path):
+        with real_scandir(path) as it:
+            return FilesFirstScandir(sorted(it, key=lambda entry: entry.is_dir()))
+    monkeypatch.setattr(os, "scandir", scandir)
+
+    organize_vault(str(sample_vault))
+
+    index = (sample_vault / "_indexes" / "_locations.md").read_text(encoding="utf-8")
+    assert index.splitlines().count("- [[ruins_note]]") == 1
+    assert index.splitlines().count("- [[city_note]]") == 1
+
+def test_indexes_list_notes_sorted_by_name(sample_vault):
+    organize_vault(str(sample_vault))
+
+    index = (sample_vault / "_indexes" / "_locations.md").read_text(encoding="utf-8")
+    assert index == "# Index for #locations\n- [[city_note]]\n- [[ruins_note]]"
+
+def test_unchanged_indexes_are_not_rewritten(sample_vault):
+    organize_vault(str(sample_vault))
+    index = sample_vault / "_indexes" / "_locations.md"
+    first_stat = index.stat()
+
+    organize_vault(str(sample_vault))
+    # A rewrite swaps in a new file, so the inode would change even within one mtime tick
+    second_stat = index.stat()
+    assert second_stat.st_ino == first_stat.st_ino
+    assert second_stat.st_mtime_ns == first_stat.st_mtime_ns
+
+def test_failed_index_write_leaves_no_temp_file(sample_vault, monkeypatch):
+    def failing_replace(src, dst):
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(os, "replace", failing_replace)
+
+    with pytest.raises(OSError):
+        organize_vault(str(sample_vault))
+
+    assert not any(name.endswith(".tmp") for name in os.listdir(sample_vault / "_indexes"))